@@ -7,14 +7,19 @@ geometric elements like bars, crosses, circles, stars, moons, rectangles,
 triangles and side features.
 """
 
-import argparse
 import os
+import re
 import sys
 import random
 import math
 from abc import ABC, abstractmethod
-from typing import List, Tuple, Dict, Optional, Any
+from typing import List, Tuple, Dict, Optional, Any, Callable, TextIO, TYPE_CHECKING, Protocol
 from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import accumulate, chain
+
+if TYPE_CHECKING:
+    import argparse
 
 
 # Country name to ISO 2-letter code mapping
@@ -62,6 +67,9 @@ COUNTRY_CODES = {
     "trinidad and tobago": "tt", "united arab emirates": "ae"
 }
 
+# Case-folded lookup table used by get_country_code
+_COUNTRY_CODES = {sys.intern(k.casefold()): sys.intern(v) for k, v in COUNTRY_CODES.items()}
+
 # Named colors mapping
 NAMED_COLORS = {
     'red': '#ff0000', 'blue': '#0000ff', 'green': '#008000', 'yellow': '#ffff00',
@@ -71,30 +79,61 @@ NAMED_COLORS = {
     'aqua': '#00ffff', 'teal': '#008080', 'silver': '#c0c0c0', 'fuchsia': '#ff00ff'
 }
 
+# Hex color patterns (6-digit and 3-digit shorthand, without the leading #)
+_HEX6 = re.compile(r'[0-9a-fA-F]{6}')
+_HEX3 = re.compile(r'[0-9a-fA-F]{3}')
+
+
+@lru_cache(maxsize=1024)
+def _fmt(value: float) -> str:
+    """Format a coordinate with at most three decimals and no trailing zeros"""
+    text = f"{value:.3f}".rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
+
+
+def _fmt_fraction(value: float) -> str:
+    """Format a bounding-box fraction with enough decimals to stay exact at flag scale"""
+    text = f"{value:.6f}".rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
+
+
+def _rect_svg(width, height, x, y, color: str) -> str:
+    """SVG markup for a rectangular flag component"""
+    return f'    <rect class="flag-component" width="{width}" height="{height}" x="{x}" y="{y}" fill="{color}"/>'
+
+
+def _polygon_svg(points: str, color: str) -> str:
+    """SVG markup for a polygonal flag component"""
+    return f'    <polygon class="flag-component" points="{points}" fill="{color}"/>'
+
+
+def _circle_svg(cx, cy, r, color: str) -> str:
+    """SVG markup for a circular flag component"""
+    return f'    <circle class="flag-component" cx="{cx}" cy="{cy}" r="{r}" fill="{color}"/>'
+
 
 class ColorManager:
     """Manages color assignment for flag elements"""
 
-    def __init__(self, colors: Optional[List[str]] = None):
+    __slots__ = ('colors', '_rng', '_color_iter')
+
+    def __init__(self, colors: Optional[List[str]] = None, seed: Optional[int] = None):
         self.colors = colors or []
-        self.index = 0
+        self._rng = random.Random(seed)
+        self.reset()
 
     def get_next_color(self) -> str:
         """Get the next color in sequence, or random if none left"""
-        if self.index < len(self.colors):
-            color = self.colors[self.index]
-            self.index += 1
-            return color
-        return self._generate_random_color()
+        return next(self._color_iter)
 
     def reset(self):
-        """Reset color index to beginning"""
-        self.index = 0
+        """Reset color sequence to beginning"""
+        # The random generator never returns the None sentinel, so this never runs out
+        self._color_iter = chain(self.colors, iter(self._generate_random_color, None))
 
-    @staticmethod
-    def _generate_random_color() -> str:
+    def _generate_random_color(self) -> str:
         """Generate a random hex color"""
-        return f"#{random.randint(0, 255):02x}{random.randint(0, 255):02x}{random.randint(0, 255):02x}"
+        return f"#{self._rng.getrandbits(24):06x}"
 
     @staticmethod
     def parse_colors(color_list: List[str]) -> List[str]:
@@ -106,34 +145,46 @@ class ColorManager:
         for color in color_list:
             # Remove # if present and validate hex
             color = color.lstrip('#')
-            if len(color) == 6 and all(c in '0123456789abcdefABCDEF' for c in color):
-                colors.append(f"#{color.lower()}")
-            elif len(color) == 3 and all(c in '0123456789abcdefABCDEF' for c in color):
+            lc = color.lower()
+            if _HEX6.fullmatch(lc):
+                normalized = f"#{lc}"
+            elif _HEX3.fullmatch(lc):
                 # Expand 3-digit hex to 6-digit
-                colors.append(f"#{color[0]*2}{color[1]*2}{color[2]*2}".lower())
+                r, g, b = lc
+                normalized = f"#{r}{r}{g}{g}{b}{b}"
             else:
                 # Try named colors
-                if color.lower() in NAMED_COLORS:
-                    colors.append(NAMED_COLORS[color.lower()])
-                else:
+                normalized = NAMED_COLORS.get(lc)
+                if normalized is None:
                     raise ValueError(f"Invalid color: {color}")
 
+            # Repeated colors share one string, so comparisons hit the identity fast path
+            colors.append(sys.intern(normalized))
+
         return colors
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class FlagDimensions:
     """Flag dimensions container"""
     width: int
     height: int
 
 
+class SvgOutput(Protocol):
+    """Where elements render to: a list of lines, or a writer streaming them to a file"""
+
+    def append(self, fragment: str) -> None: ...
+
+
 class FlagElement(ABC):
     """Abstract base class for all flag elements"""
 
+    __slots__ = ()
+
     @abstractmethod
-    def render(self, color_manager: ColorManager) -> List[str]:
-        """Render the element as SVG strings"""
+    def render(self, color_manager: ColorManager, out: SvgOutput) -> None:
+        """Append the element's SVG strings to out"""
         pass
 
     @abstractmethod
@@ -146,16 +197,50 @@ class FlagElement(ABC):
         """Validate the element against flag dimensions. Returns error message if invalid."""
         pass
 
+    def validate_all(self, dimensions: FlagDimensions) -> List[str]:
+        """Validate the element, returning any error messages as a list"""
+        error = self.validate(dimensions)
+        return [error] if error else []
+
+    def outline(self) -> Optional[List[Tuple[float, float]]]:
+        """Return the element's polygon vertices if it can be merged into a path"""
+        return None
+
+    def _point_strings(self, points: List[Tuple[float, float]]) -> List[str]:
+        """Format outline vertices as "x,y" strings"""
+        return [f"{x},{y}" for x, y in points]
+
+    def _polygon_points(self) -> str:
+        """The outline as a <polygon> points attribute"""
+        return " ".join(self._point_strings(self.outline()))
+
+    def subpath(self) -> Optional[str]:
+        """Return closed, clockwise path data for the element if it can be merged into a path"""
+        points = self.outline()
+        if points is None:
+            return None
 
-@dataclass
+        # Merged subpaths are filled with the default nonzero rule, so they all need
+        # the same winding or overlapping shapes would cut holes in each other
+        coords = self._point_strings(points)
+        if _signed_area(points) < 0:
+            coords.reverse()
+        return f"M {' L '.join(coords)} Z"
+
+
+def _signed_area(points: List[Tuple[float, float]]) -> float:
+    """Twice the signed area of a polygon; positive when clockwise in SVG's y-down coordinates"""
+    return sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1]))
+
+
+@dataclass(slots=True, frozen=True)
 class Background(FlagElement):
     """Solid background rectangle"""
     dimensions: FlagDimensions
 
-    def render(self, color_manager: ColorManager) -> List[str]:
+    def render(self, color_manager: ColorManager, out: SvgOutput) -> None:
         color = color_manager.get_next_color()
-        return [f'    <rect class="flag-component" width="{self.dimensions.width}" '
-                f'height="{self.dimensions.height}" x="0" y="0" fill="{color}"/>']
+        out.append(_rect_svg(self.dimensions.width, self.dimensions.height, 0, 0, color))
 
     def describe(self) -> str:
         return "background"
@@ -164,66 +249,36 @@ class Background(FlagElement):
         return None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Bars(FlagElement):
     """Horizontal or vertical bars"""
     dimensions: FlagDimensions
     orientation: str  # 'horizontal' or 'vertical'
     count: int
-    widths: Optional[List[int]] = None  # Custom widths/heights for each bar
-
-    def render(self, color_manager: ColorManager) -> List[str]:
-        elements = []
-
-        if self.orientation == 'horizontal':
-            if self.widths:
-                # Use custom heights
-                current_y = 0
-                for i, height in enumerate(self.widths):
-                    color = color_manager.get_next_color()
-                    elements.append(f'    <rect class="flag-component" width="{self.dimensions.width}" '
-                                  f'height="{height}" x="0" y="{current_y}" fill="{color}"/>')
-                    current_y += height
-            else:
-                # Equal division
-                bar_height = self.dimensions.height // self.count
-                remainder = self.dimensions.height % self.count
-
-                for i in range(self.count):
-                    y = i * bar_height
-                    current_height = bar_height + (1 if i < remainder else 0)
-                    if i >= remainder:
-                        y += remainder
-
-                    color = color_manager.get_next_color()
-                    elements.append(f'    <rect class="flag-component" width="{self.dimensions.width}" '
-                                  f'height="{current_height}" x="0" y="{y}" fill="{color}"/>')
-
-        else:  # vertical
-            if self.widths:
-                # Use custom widths
-                current_x = 0
-                for i, width in enumerate(self.widths):
-                    color = color_manager.get_next_color()
-                    elements.append(f'    <rect class="flag-component" width="{width}" '
-                                  f'height="{self.dimensions.height}" x="{current_x}" y="0" fill="{color}"/>')
-                    current_x += width
-            else:
-                # Equal division
-                bar_width = self.dimensions.width // self.count
-                remainder = self.dimensions.width % self.count
+    widths: Optional[Tuple[int, ...]] = None  # Custom widths/heights for each bar
 
-                for i in range(self.count):
-                    x = i * bar_width
-                    current_width = bar_width + (1 if i < remainder else 0)
-                    if i >= remainder:
-                        x += remainder
+    def __post_init__(self):
+        if self.widths is not None:
+            object.__setattr__(self, 'widths', tuple(self.widths))
 
-                    color = color_manager.get_next_color()
-                    elements.append(f'    <rect class="flag-component" width="{current_width}" '
-                                  f'height="{self.dimensions.height}" x="{x}" y="0" fill="{color}"/>')
+    def render(self, color_manager: ColorManager, out: SvgOutput) -> None:
+        horizontal = self.orientation == 'horizontal'
 
-        return elements
+        if self.widths:
+            # Use custom widths/heights
+            sizes = self.widths
+        else:
+            # Equal division, spreading any remainder over the first bars
+            total = self.dimensions.height if horizontal else self.dimensions.width
+            bar_size, remainder = divmod(total, self.count)
+            sizes = [bar_size + 1] * remainder + [bar_size] * (self.count - remainder)
+
+        for offset, size in zip(accumulate(sizes, initial=0), sizes):
+            color = color_manager.get_next_color()
+            if horizontal:
+                out.append(_rect_svg(self.dimensions.width, size, 0, offset, color))
+            else:
+                out.append(_rect_svg(size, self.dimensions.height, offset, 0, color))
 
     def describe(self) -> str:
         if self.widths:
@@ -266,7 +321,7 @@ class Bars(FlagElement):
         return None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Side(FlagElement):
     """Side feature (bar, triangle, or trapezoid)"""
     dimensions: FlagDimensions
@@ -274,49 +329,40 @@ class Side(FlagElement):
     right_edge_length: int
     position: str = 'left'  # 'left' or 'right'
 
-    def render(self, color_manager: ColorManager) -> List[str]:
+    def render(self, color_manager: ColorManager, out: SvgOutput) -> None:
         color = color_manager.get_next_color()
 
         # Determine shape type based on dimensions
         if self.right_edge_length == self.dimensions.height:
             # Bar (rectangle)
-            if self.position == 'left':
-                return [f'    <rect class="flag-component" width="{self.width}" '
-                       f'height="{self.dimensions.height}" x="0" y="0" fill="{color}"/>']
-            else:  # right
-                x_pos = self.dimensions.width - self.width
-                return [f'    <rect class="flag-component" width="{self.width}" '
-                       f'height="{self.dimensions.height}" x="{x_pos}" y="0" fill="{color}"/>']
+            x_pos = 0 if self.position == 'left' else self.dimensions.width - self.width
+            out.append(_rect_svg(_fmt(self.width), self.dimensions.height, _fmt(x_pos), 0, color))
 
-        elif self.right_edge_length == 0:
-            # Triangle
-            if self.position == 'left':
-                # Triangle pointing right, tip at vertical center
-                center_y = self.dimensions.height // 2
-                points = f"0,0 {self.width},{center_y} 0,{self.dimensions.height}"
-            else:  # right
-                # Triangle pointing left, tip at vertical center
-                center_y = self.dimensions.height // 2
-                x_base = self.dimensions.width - self.width
-                points = f"{self.dimensions.width},0 {x_base},{center_y} {self.dimensions.width},{self.dimensions.height}"
-
-            return [f'    <polygon class="flag-component" points="{points}" fill="{color}"/>']
+        else:
+            # Triangle or trapezoid
+            out.append(_polygon_svg(self._polygon_points(), color))
 
+    def outline(self) -> Optional[List[Tuple[float, float]]]:
+        flag_width, flag_height = self.dimensions.width, self.dimensions.height
+        x_base = 0 if self.position == 'left' else flag_width - self.width
+        edge_x = 0 if self.position == 'left' else flag_width  # flag edge the side sits on
+
+        if self.right_edge_length == flag_height:
+            # Bar (rectangle)
+            points = [(x_base, 0), (x_base + self.width, 0),
+                      (x_base + self.width, flag_height), (x_base, flag_height)]
         else:
-            # Trapezoid
-            if self.position == 'left':
-                # Left trapezoid
-                top_y = (self.dimensions.height - self.right_edge_length) // 2
-                bottom_y = top_y + self.right_edge_length
-                points = f"0,0 {self.width},{top_y} {self.width},{bottom_y} 0,{self.dimensions.height}"
-            else:  # right
-                # Right trapezoid
-                top_y = (self.dimensions.height - self.right_edge_length) // 2
-                bottom_y = top_y + self.right_edge_length
-                x_base = self.dimensions.width - self.width
-                points = f"{self.dimensions.width},0 {x_base},{top_y} {x_base},{bottom_y} {self.dimensions.width},{self.dimensions.height}"
-
-            return [f'    <polygon class="flag-component" points="{points}" fill="{color}"/>']
+            # Triangle (tip at vertical center) or trapezoid
+            top_y = (flag_height - self.right_edge_length) // 2
+            bottom_y = top_y + self.right_edge_length
+            inner_x = self.width if self.position == 'left' else x_base
+            inner = [(inner_x, top_y)] if self.right_edge_length == 0 else [(inner_x, top_y), (inner_x, bottom_y)]
+            points = [(edge_x, 0), *inner, (edge_x, flag_height)]
+
+        return points
+
+    def _point_strings(self, points: List[Tuple[float, float]]) -> List[str]:
+        return [f"{_fmt(x)},{_fmt(y)}" for x, y in points]
 
     def describe(self) -> str:
         if self.right_edge_length == self.dimensions.height:
@@ -342,7 +388,7 @@ class Side(FlagElement):
         return None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Cross(FlagElement):
     """Cross element"""
     dimensions: FlagDimensions
@@ -350,28 +396,18 @@ class Cross(FlagElement):
     center_y: int
     width: int
 
-    def render(self, color_manager: ColorManager) -> List[str]:
-        half_width = self.width // 2
+    def render(self, color_manager: ColorManager, out: SvgOutput) -> None:
+        color = color_manager.get_next_color()
+        out.append(_polygon_svg(self._polygon_points(), color))
+
+    def outline(self) -> Optional[List[Tuple[float, float]]]:
+        cx, cy, hw = self.center_x, self.center_y, self.width // 2
+        w, h = self.dimensions.width, self.dimensions.height
 
         # Cross polygon points (extending to edges)
-        cross_points = [
-            (self.center_x - half_width, 0),
-            (self.center_x + half_width, 0),
-            (self.center_x + half_width, self.center_y - half_width),
-            (self.dimensions.width, self.center_y - half_width),
-            (self.dimensions.width, self.center_y + half_width),
-            (self.center_x + half_width, self.center_y + half_width),
-            (self.center_x + half_width, self.dimensions.height),
-            (self.center_x - half_width, self.dimensions.height),
-            (self.center_x - half_width, self.center_y + half_width),
-            (0, self.center_y + half_width),
-            (0, self.center_y - half_width),
-            (self.center_x - half_width, self.center_y - half_width)
-        ]
-
-        points_str = " ".join([f"{x},{y}" for x, y in cross_points])
-        color = color_manager.get_next_color()
-        return [f'    <polygon class="flag-component" points="{points_str}" fill="{color}"/>']
+        return [(cx-hw, 0), (cx+hw, 0), (cx+hw, cy-hw), (w, cy-hw),
+                (w, cy+hw), (cx+hw, cy+hw), (cx+hw, h), (cx-hw, h),
+                (cx-hw, cy+hw), (0, cy+hw), (0, cy-hw), (cx-hw, cy-hw)]
 
     def describe(self) -> str:
         return f"cross at ({self.center_x},{self.center_y}) width {self.width}"
@@ -384,16 +420,15 @@ class Cross(FlagElement):
         return None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Canton(FlagElement):
     """Canton (top-left rectangular overlay)"""
     width: int
     height: int
 
-    def render(self, color_manager: ColorManager) -> List[str]:
+    def render(self, color_manager: ColorManager, out: SvgOutput) -> None:
         color = color_manager.get_next_color()
-        return [f'    <rect class="flag-component" width="{self.width}" '
-                f'height="{self.height}" x="0" y="0" fill="{color}"/>']
+        out.append(_rect_svg(self.width, self.height, 0, 0, color))
 
     def describe(self) -> str:
         return f"canton ({self.width}x{self.height})"
@@ -410,17 +445,21 @@ class Canton(FlagElement):
         return None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Circle(FlagElement):
     """Circle element"""
     center_x: int
     center_y: int
     radius: int
 
-    def render(self, color_manager: ColorManager) -> List[str]:
+    def render(self, color_manager: ColorManager, out: SvgOutput) -> None:
         color = color_manager.get_next_color()
-        return [f'    <circle class="flag-component" cx="{self.center_x}" '
-                f'cy="{self.center_y}" r="{self.radius}" fill="{color}"/>']
+        out.append(_circle_svg(self.center_x, self.center_y, self.radius, color))
+
+    def subpath(self) -> Optional[str]:
+        # Two clockwise half-circle arcs, matching the winding of the polygon subpaths
+        cx, cy, r = self.center_x, self.center_y, self.radius
+        return f"M {cx - r},{cy} A {r},{r} 0 1,1 {cx + r},{cy} A {r},{r} 0 1,1 {cx - r},{cy} Z"
 
     def describe(self) -> str:
         return f"circle at ({self.center_x},{self.center_y}) radius {self.radius}"
@@ -433,7 +472,21 @@ class Circle(FlagElement):
         return None
 
 
-@dataclass
+@lru_cache(maxsize=64)
+def _star_unit_vertices(points: int, angle: float) -> Tuple[Tuple[float, float], ...]:
+    """Unit-circle (cos, sin) pairs for a star's alternating outer/inner vertices.
+
+    Stars on a flag usually share their point count and orientation, so the
+    trig is done once per (points, angle) and reused across instances.
+    """
+    # Convert to radians once; each vertex is then a fixed step further round
+    start = math.radians(angle - 90)
+    step = math.pi / points
+    return tuple((math.cos(start + i * step), math.sin(start + i * step))
+                 for i in range(points * 2))
+
+
+@dataclass(slots=True, frozen=True)
 class Star(FlagElement):
     """Star element with configurable number of points"""
     points: int
@@ -442,22 +495,25 @@ class Star(FlagElement):
     radius: float
     angle: float
 
-    def render(self, color_manager: ColorManager) -> List[str]:
+    def render(self, color_manager: ColorManager, out: SvgOutput) -> None:
+        color = color_manager.get_next_color()
+        out.append(_polygon_svg(self._polygon_points(), color))
+
+    def outline(self) -> Optional[List[Tuple[float, float]]]:
         points = []
         inner_radius = self.radius * 0.4
 
-        step = 360 / (self.points * 2)
-        for i in range(self.points * 2):
+        for i, (cos_a, sin_a) in enumerate(_star_unit_vertices(self.points, self.angle)):
             current_radius = self.radius if i % 2 == 0 else inner_radius
-            point_angle = math.radians(self.angle + i * step - 90)
 
-            x = self.center_x + current_radius * math.cos(point_angle)
-            y = self.center_y + current_radius * math.sin(point_angle)
+            x = self.center_x + current_radius * cos_a
+            y = self.center_y + current_radius * sin_a
             points.append((x, y))
 
-        points_str = " ".join([f"{x:.2f},{y:.2f}" for x, y in points])
-        color = color_manager.get_next_color()
-        return [f'    <polygon class="flag-component" points="{points_str}" fill="{color}"/>']
+        return points
+
+    def _point_strings(self, points: List[Tuple[float, float]]) -> List[str]:
+        return [f"{x:.2f},{y:.2f}" for x, y in points]
 
     def describe(self) -> str:
         return (
@@ -475,7 +531,7 @@ class Star(FlagElement):
         return None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Moon(FlagElement):
     """Crescent moon element"""
     moon_x: float
@@ -485,24 +541,32 @@ class Moon(FlagElement):
     mask_dy: float
     mask_radius: float
     element_id: int = field(default=0)
+    shared_mask: bool = field(default=False)  # reuse the mask defined by moon element_id
 
-    def render(self, color_manager: ColorManager) -> List[str]:
+    def render(self, color_manager: ColorManager, out: SvgOutput) -> None:
         mask_id = f"moon-mask-{self.element_id}"
-        mask_center_x = self.moon_x + self.mask_dx
-        mask_center_y = self.moon_y + self.mask_dy
 
-        mask_def = f'''    <defs>
-        <mask id="{mask_id}">
-            <circle cx="{self.moon_x}" cy="{self.moon_y}" r="{self.moon_radius}" fill="white"/>
-            <circle cx="{mask_center_x}" cy="{mask_center_y}" r="{self.mask_radius}" fill="black"/>
+        moon_x, moon_y, moon_radius = _fmt(self.moon_x), _fmt(self.moon_y), _fmt(self.moon_radius)
+
+        if not self.shared_mask:
+            # The mask is drawn in the moon's bounding box (0..1 across its diameter),
+            # so moons of the same shape can share it wherever they are placed
+            diameter = 2 * self.moon_radius
+            mask_center_x = _fmt_fraction(0.5 + self.mask_dx / diameter)
+            mask_center_y = _fmt_fraction(0.5 + self.mask_dy / diameter)
+            mask_radius = _fmt_fraction(self.mask_radius / diameter)
+
+            out.append(f'''    <defs>
+        <mask id="{mask_id}" maskContentUnits="objectBoundingBox">
+            <circle cx="0.5" cy="0.5" r="0.5" fill="white"/>
+            <circle cx="{mask_center_x}" cy="{mask_center_y}" r="{mask_radius}" fill="black"/>
         </mask>
-    </defs>'''
+    </defs>''')
 
         color = color_manager.get_next_color()
-        moon_circle = f'    <circle class="flag-component" cx="{self.moon_x}" cy="{self.moon_y}" '
-        moon_circle += f'r="{self.moon_radius}" fill="{color}" mask="url(#{mask_id})"/>'
-
-        return [mask_def, moon_circle]
+        moon_circle = f'    <circle class="flag-component" cx="{moon_x}" cy="{moon_y}" '
+        moon_circle += f'r="{moon_radius}" fill="{color}" mask="url(#{mask_id})"/>'
+        out.append(moon_circle)
 
     def describe(self) -> str:
         return (f"moon at ({self.moon_x},{self.moon_y}) radius {self.moon_radius} "
@@ -518,7 +582,7 @@ class Moon(FlagElement):
         return None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Rect(FlagElement):
     """Simple rectangle element"""
     x: int
@@ -526,12 +590,13 @@ class Rect(FlagElement):
     width: int
     height: int
 
-    def render(self, color_manager: ColorManager) -> List[str]:
+    def render(self, color_manager: ColorManager, out: SvgOutput) -> None:
         color = color_manager.get_next_color()
-        return [
-            f'    <rect class="flag-component" x="{self.x}" y="{self.y}" '
-            f'width="{self.width}" height="{self.height}" fill="{color}"/>'
-        ]
+        out.append(_rect_svg(self.width, self.height, self.x, self.y, color))
+
+    def outline(self) -> Optional[List[Tuple[float, float]]]:
+        x2, y2 = self.x + self.width, self.y + self.height
+        return [(self.x, self.y), (x2, self.y), (x2, y2), (self.x, y2)]
 
     def describe(self) -> str:
         return f"rect {self.width}x{self.height} at ({self.x},{self.y})"
@@ -546,7 +611,7 @@ class Rect(FlagElement):
         return None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Triangle(FlagElement):
     """Triangle element defined by three points"""
     x1: int
@@ -556,10 +621,12 @@ class Triangle(FlagElement):
     x3: int
     y3: int
 
-    def render(self, color_manager: ColorManager) -> List[str]:
+    def render(self, color_manager: ColorManager, out: SvgOutput) -> None:
         color = color_manager.get_next_color()
-        points = f"{self.x1},{self.y1} {self.x2},{self.y2} {self.x3},{self.y3}"
-        return [f'    <polygon class="flag-component" points="{points}" fill="{color}"/>']
+        out.append(_polygon_svg(self._polygon_points(), color))
+
+    def outline(self) -> Optional[List[Tuple[float, float]]]:
+        return [(self.x1, self.y1), (self.x2, self.y2), (self.x3, self.y3)]
 
     def describe(self) -> str:
         return f"triangle ({self.x1},{self.y1})-({self.x2},{self.y2})-({self.x3},{self.y3})"
@@ -571,25 +638,54 @@ class Triangle(FlagElement):
         return None
 
 
+@dataclass(slots=True, frozen=True)
 class ElementCollection:
     """Manages multiple elements of the same type"""
-
-    def __init__(self, element_type: str, elements: List[FlagElement]):
-        self.element_type = element_type
-        self.elements = elements
-
-    def render(self, color_manager: ColorManager) -> List[str]:
-        result = []
+    element_type: str
+    elements: Tuple[FlagElement, ...]
+    merge_paths: bool = False
+
+    def __post_init__(self):
+        # Collections compare and hash by value, so keep them immutable
+        object.__setattr__(self, 'elements', tuple(self.elements))
+
+    def render(self, color_manager: ColorManager, out: SvgOutput) -> None:
+        if not self.merge_paths:
+            for element in self.elements:
+                element.render(color_manager, out)
+            return
+
+        # Merge runs of consecutive same-colored shapes into a single <path>
+        run_color = None
+        run: List[str] = []
         for element in self.elements:
-            result.extend(element.render(color_manager))
-        return result
+            subpath = element.subpath()
+            if subpath is None:
+                self._flush_path(run_color, run, out)
+                run_color = None
+                element.render(color_manager, out)
+                continue
+
+            color = color_manager.get_next_color()
+            if color != run_color:
+                self._flush_path(run_color, run, out)
+                run_color = color
+            run.append(subpath)
+        self._flush_path(run_color, run, out)
+
+    @staticmethod
+    def _flush_path(color: Optional[str], subpaths: List[str], out: SvgOutput):
+        """Emit the pending subpaths as one path element and clear them"""
+        if subpaths:
+            out.append(f'    <path class="flag-component" d="{" ".join(subpaths)}" fill="{color}"/>')
+            subpaths.clear()
 
     def describe(self) -> str:
         if len(self.elements) == 1:
             return self.elements[0].describe()
         return f"{len(self.elements)} {self.element_type}s"
 
-    def validate(self, dimensions: FlagDimensions) -> List[str]:
+    def validate_all(self, dimensions: FlagDimensions) -> List[str]:
         errors = []
         for i, element in enumerate(self.elements):
             error = element.validate(dimensions)
@@ -598,9 +694,42 @@ class ElementCollection:
         return errors
 
 
+_SVG_FOOTER = '</svg>'
+
+
+@lru_cache(maxsize=64, typed=True)  # typed: 30 and 30.0 format differently
+def _svg_header(width: int, height: int) -> str:
+    """Opening <svg> tag for a flag of the given dimensions"""
+    return f'<svg viewBox="0 0 {width} {height}" xmlns="http://www.w3.org/2000/svg">'
+
+
+def _render_svg(svg_header: str, renderers: List[Callable], color_manager: ColorManager) -> str:
+    """Render the element render methods, in order, into a complete SVG document"""
+    parts = [svg_header]
+    for render_element in renderers:
+        render_element(color_manager, parts)
+    parts.append(_SVG_FOOTER)
+    return '\n'.join(parts)
+
+
+class _LineWriter:
+    """SvgOutput that writes each fragment straight to a file"""
+
+    __slots__ = ('write',)
+
+    def __init__(self, fp: TextIO):
+        self.write = fp.write
+
+    def append(self, fragment: str):
+        self.write(fragment)
+        self.write('\n')
+
+
 class FlagGenerator:
     """Main flag generator class"""
 
+    __slots__ = ('dimensions', 'color_manager', 'merge_paths', 'elements', 'descriptions')
+
     # Element rendering order (background first, then overlays)
     RENDER_ORDER = [
         'background',
@@ -615,9 +744,11 @@ class FlagGenerator:
         'moons'
     ]
 
-    def __init__(self, dimensions: FlagDimensions, colors: Optional[List[str]] = None):
+    def __init__(self, dimensions: FlagDimensions, colors: Optional[List[str]] = None,
+                 merge_paths: bool = False, seed: Optional[int] = None):
         self.dimensions = dimensions
-        self.color_manager = ColorManager(colors)
+        self.color_manager = ColorManager(colors, seed)
+        self.merge_paths = merge_paths
         self.elements: Dict[str, Any] = {}
         self.descriptions: List[str] = []
 
@@ -641,99 +772,132 @@ class FlagGenerator:
     def add_sides(self, sides_data: List[Tuple[int, int, str]]):
         """Add one or more side features"""
         sides = [Side(self.dimensions, width, right_edge, pos) for width, right_edge, pos in sides_data]
-        self.elements['sides'] = ElementCollection('side', sides)
+        self.elements['sides'] = ElementCollection('side', sides, self.merge_paths)
         self.descriptions.append(self.elements['sides'].describe())
 
     def add_crosses(self, crosses_data: List[Tuple[int, int, int]]):
         """Add one or more crosses"""
         crosses = [Cross(self.dimensions, x, y, w) for x, y, w in crosses_data]
-        self.elements['crosses'] = ElementCollection('cross', crosses)
+        self.elements['crosses'] = ElementCollection('cross', crosses, self.merge_paths)
         self.descriptions.append(self.elements['crosses'].describe())
 
     def add_circles(self, circles_data: List[Tuple[int, int, int]]):
         """Add one or more circles"""
         circles = [Circle(x, y, r) for x, y, r in circles_data]
-        self.elements['circles'] = ElementCollection('circle', circles)
+        self.elements['circles'] = ElementCollection('circle', circles, self.merge_paths)
         self.descriptions.append(self.elements['circles'].describe())
 
     def add_rects(self, rects_data: List[Tuple[int, int, int, int]]):
         """Add one or more rectangles"""
         rects = [Rect(x, y, w, h) for x, y, w, h in rects_data]
-        self.elements['rects'] = ElementCollection('rect', rects)
+        self.elements['rects'] = ElementCollection('rect', rects, self.merge_paths)
         self.descriptions.append(self.elements['rects'].describe())
 
     def add_triangles(self, triangles_data: List[Tuple[int, int, int, int, int, int]]):
         """Add one or more triangles"""
         triangles = [Triangle(x1, y1, x2, y2, x3, y3) for x1, y1, x2, y2, x3, y3 in triangles_data]
-        self.elements['triangles'] = ElementCollection('triangle', triangles)
+        self.elements['triangles'] = ElementCollection('triangle', triangles, self.merge_paths)
         self.descriptions.append(self.elements['triangles'].describe())
 
     def add_stars(self, stars_data: List[Tuple[int, float, float, float, float]]):
         """Add one or more stars"""
         stars = [Star(int(p), x, y, r, a) for p, x, y, r, a in stars_data]
-        self.elements['stars'] = ElementCollection('star', stars)
+        self.elements['stars'] = ElementCollection('star', stars, self.merge_paths)
         self.descriptions.append(self.elements['stars'].describe())
 
     def add_moons(self, moons_data: List[Tuple[float, float, float, float, float, float]]):
         """Add one or more moons"""
-        moons = [Moon(x, y, r, dx, dy, mr, i)
-                 for i, (x, y, r, dx, dy, mr) in enumerate(moons_data)]
-        self.elements['moons'] = ElementCollection('moon', moons)
+        moons = []
+        mask_ids: Dict[Tuple, int] = {}
+        for i, geometry in enumerate(moons_data):
+            # Masks are relative to the moon, so moons that differ only in position share one
+            moon_x, moon_y, *shape = geometry
+            mask_id = mask_ids.setdefault(tuple(shape), i)
+            moons.append(Moon(*geometry, mask_id, mask_id != i))
+        self.elements['moons'] = ElementCollection('moon', moons, self.merge_paths)
         self.descriptions.append(self.elements['moons'].describe())
 
-    def validate(self) -> List[str]:
+    def validate(self) -> Tuple[List[str], List[str]]:
         """Validate all elements"""
         errors = []
         warnings = []
 
-        for element_type, element in self.elements.items():
-            if isinstance(element, FlagElement):
-                result = element.validate(self.dimensions)
-                if result:
-                    if result.startswith("Warning:"):
-                        warnings.append(result)
-                    else:
-                        errors.append(result)
-            elif isinstance(element, ElementCollection):
-                results = element.validate(self.dimensions)
-                for result in results:
-                    if result.startswith("Warning:"):
-                        warnings.append(result)
-                    else:
-                        errors.append(result)
+        # A plain background (the default solid rectangle) has nothing to check
+        if self.elements.keys() <= {'background'}:
+            return errors, warnings
+
+        for element in self.elements.values():
+            for result in element.validate_all(self.dimensions):
+                if result.startswith("Warning:"):
+                    warnings.append(result)
+                else:
+                    errors.append(result)
 
         return errors, warnings
 
-    def generate_svg(self) -> str:
-        """Generate the complete SVG content"""
-        svg_header = f'<svg viewBox="0 0 {self.dimensions.width} {self.dimensions.height}" xmlns="http://www.w3.org/2000/svg">'
-        svg_footer = '</svg>'
+    def compile(self) -> Callable[[ColorManager], str]:
+        """Return a renderer specialised to the current elements.
 
-        elements = []
+        The header and the ordered render methods are resolved once, so the
+        same flag can be rendered repeatedly (e.g. with different color
+        managers) without walking RENDER_ORDER each time.
+        """
+        svg_header = _svg_header(self.dimensions.width, self.dimensions.height)
+        renderers = [element.render for element in self._ordered_elements()]
 
-        # Render elements in the correct order
-        for element_type in self.RENDER_ORDER:
-            if element_type in self.elements:
-                element = self.elements[element_type]
-                if isinstance(element, FlagElement):
-                    elements.extend(element.render(self.color_manager))
-                elif isinstance(element, ElementCollection):
-                    elements.extend(element.render(self.color_manager))
+        def render(color_manager: ColorManager) -> str:
+            return _render_svg(svg_header, renderers, color_manager)
 
-        return '\n'.join([svg_header] + elements + [svg_footer])
+        return render
+
+    def generate_svg(self) -> str:
+        """Generate the complete SVG content"""
+        return self.compile()(self.color_manager)
+
+    def write_svg(self, fp: TextIO):
+        """Write the complete SVG content to a text file object"""
+        # Stream each element's markup to the file rather than building the document first
+        fp.write(_svg_header(self.dimensions.width, self.dimensions.height))
+        fp.write('\n')
+        writer = _LineWriter(fp)
+        for element in self._ordered_elements():
+            element.render(self.color_manager, writer)
+        fp.write(_SVG_FOOTER)
+
+    def _ordered_elements(self) -> Tuple:
+        """Elements in the correct rendering order"""
+        return tuple(self.elements[element_type]
+                     for element_type in self.RENDER_ORDER if element_type in self.elements)
 
     def get_description(self) -> str:
         """Get a human-readable description of the flag"""
         return " + ".join(self.descriptions)
 
 
+@lru_cache(maxsize=256)
 def get_country_code(country_name: str) -> Optional[str]:
     """Convert country name to ISO 2-letter code"""
-    return COUNTRY_CODES.get(country_name.lower())
+    return _COUNTRY_CODES.get(country_name.casefold())
+
 
+def _parse_bars(spec: str) -> Tuple[int, Optional[List[int]]]:
+    """argparse type parsing a bar count ("3") or comma-separated sizes ("9,6,3") into (count, sizes)"""
+    try:
+        sizes = [int(part) for part in spec.split(',')]
+    except ValueError:
+        import argparse  # already loaded, since only the parser calls this
+        raise argparse.ArgumentTypeError(f"all bar values must be integers, got '{spec}'")
+    if len(sizes) == 1:
+        return sizes[0], None
+    return len(sizes), sizes
+
+
+@lru_cache(maxsize=None)
+def create_parser() -> 'argparse.ArgumentParser':
+    """Create and configure the argument parser (built once per process)"""
+    # Imported here so using the generator as a library doesn't pay for argparse
+    import argparse
 
-def create_parser() -> argparse.ArgumentParser:
-    """Create and configure the argument parser"""
     parser = argparse.ArgumentParser(
         description='Generate SVG flag templates',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -755,16 +919,17 @@ def create_parser() -> argparse.ArgumentParser:
   %(prog)s complex -x 40 -y 30 --star 5 10 10 4 0 --moon 30 20 5 2 -2 -c navy white yellow  # Star and moon
   %(prog)s rectdemo -x 20 -y 15 --rect 5 5 10 5 -c white red  # Add a rectangle
   %(prog)s tridemo -x 20 -y 15 --triangle 0 0 10 15 20 0 -c blue white yellow  # Add a triangle
+  %(prog)s france -x 18 -y 15 --vertical 3 --stdout | rsvg-convert -o fr.png  # Pipe the SVG to another tool
         '''
     )
 
     parser.add_argument('country', help='Country name')
     parser.add_argument('-x', '--width', type=int, required=True, help='SVG width in units')
     parser.add_argument('-y', '--height', type=int, required=True, help='SVG height in units')
-    parser.add_argument('-v', '--vertical', type=str, metavar='BARS_OR_WIDTHS',
+    parser.add_argument('-v', '--vertical', type=_parse_bars, metavar='BARS_OR_WIDTHS',
                        help='Create vertical bars. Use single number for equal bars (e.g., --vertical 3) '
                             'or comma-separated numbers for custom widths (e.g., --vertical "10,8,12")')
-    parser.add_argument('--horizontal', type=str, metavar='BARS_OR_HEIGHTS',
+    parser.add_argument('--horizontal', type=_parse_bars, metavar='BARS_OR_HEIGHTS',
                        help='Create horizontal bars. Use single number for equal bars (e.g., --horizontal 3) '
                             'or comma-separated numbers for custom heights (e.g., --horizontal "8,12,8")')
     parser.add_argument('--canton', nargs=2, type=int, metavar=('WIDTH', 'HEIGHT'),
@@ -795,52 +960,40 @@ def create_parser() -> argparse.ArgumentParser:
                        help='Create a triangle using three points. Can be used multiple times.')
     parser.add_argument('-c', '--colors', nargs='+', metavar='COLOR',
                        help='Specify colors (hex codes, 3/6 digits, or named colors)')
-    parser.add_argument('-o', '--output', help='Output directory (default: ./public/flags/)')
+    destination = parser.add_mutually_exclusive_group()
+    destination.add_argument('-o', '--output',
+                            help='Output directory (default: ./public/flags/), or "-" to write to stdout')
+    destination.add_argument('--stdout', action='store_true',
+                            help='Write the SVG to stdout instead of a file; messages go to stderr')
+    parser.add_argument('--merge-paths', action='store_true',
+                       help='Merge consecutive same-colored shapes of one type into a single <path>. '
+                            'Merged shapes are no longer separate flag components.')
+    parser.add_argument('--seed', type=int,
+                       help='Seed for the random colors used when fewer colors than components are given')
 
     return parser
 
 
-def main():
-    """Main entry point"""
+def _current_umask() -> int:
+    """The process umask (it can only be read by setting it)"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def main(argv: Optional[List[str]] = None):
+    """Main entry point. argv defaults to sys.argv[1:], so scripts can call main() per flag."""
     parser = create_parser()
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     # Validate mutually exclusive bar orientations
     if args.vertical and args.horizontal:
         print("Error: Cannot specify both --vertical and --horizontal", file=sys.stderr)
         return 1
 
-    # Parse bar arguments
-    vertical_count = None
-    vertical_widths = None
-    horizontal_count = None
-    horizontal_heights = None
-
-    if args.vertical:
-        try:
-            # Handle comma-separated values or single value
-            if ',' in args.vertical:
-                vertical_values = [int(x.strip()) for x in args.vertical.split(',')]
-                vertical_count = len(vertical_values)
-                vertical_widths = vertical_values
-            else:
-                vertical_count = int(args.vertical)
-        except ValueError:
-            print("Error: All vertical bar values must be integers", file=sys.stderr)
-            return 1
-
-    if args.horizontal:
-        try:
-            # Handle comma-separated values or single value
-            if ',' in args.horizontal:
-                horizontal_values = [int(x.strip()) for x in args.horizontal.split(',')]
-                horizontal_count = len(horizontal_values)
-                horizontal_heights = horizontal_values
-            else:
-                horizontal_count = int(args.horizontal)
-        except ValueError:
-            print("Error: All horizontal bar values must be integers", file=sys.stderr)
-            return 1
+    # Bar arguments are parsed by argparse into (count, sizes)
+    vertical_count, vertical_widths = args.vertical or (None, None)
+    horizontal_count, horizontal_heights = args.horizontal or (None, None)
 
     # Parse colors if provided
     colors = None
@@ -869,17 +1022,9 @@ def main():
                 print(f"Error: Invalid side arguments: {e}", file=sys.stderr)
                 return 1
 
-    # Parse rectangle arguments if provided
-    rects_data = []
-    if args.rect:
-        for rect_args in args.rect:
-            rects_data.append(tuple(rect_args))
-
-    # Parse triangle arguments if provided
-    triangles_data = []
-    if args.triangle:
-        for tri_args in args.triangle:
-            triangles_data.append(tuple(tri_args))
+    # Rectangle and triangle arguments are already lists of ints
+    rects_data = args.rect or []
+    triangles_data = args.triangle or []
 
     # Get country code
     country_code = get_country_code(args.country)
@@ -889,25 +1034,19 @@ def main():
 
     # Create flag generator
     dimensions = FlagDimensions(args.width, args.height)
-    generator = FlagGenerator(dimensions, colors)
-
-    # Check if we need a background (when using overlays)
-    needs_background = bool(
-        args.cross or args.circle or args.star or args.moon or
-        rects_data or triangles_data or sides_data or args.canton
-    )
+    generator = FlagGenerator(dimensions, colors, args.merge_paths, args.seed)
 
     # Add elements
     if args.vertical:
         generator.add_bars('vertical', vertical_count, vertical_widths)
     elif args.horizontal:
         generator.add_bars('horizontal', horizontal_count, horizontal_heights)
-    elif needs_background:
-        generator.add_background()
     else:
-        # Default solid rectangle
         generator.add_background()
-        generator.descriptions[-1] = "solid rectangle"
+        # Without any overlays the flag is just a solid rectangle
+        if not any((args.cross, args.circle, args.star, args.moon,
+                    rects_data, triangles_data, sides_data, args.canton)):
+            generator.descriptions[-1] = "solid rectangle"
 
     # Add side features
     if sides_data:
@@ -939,9 +1078,13 @@ def main():
     # Validate all elements
     errors, warnings = generator.validate()
 
+    # Keep stdout clean for the SVG when piping
+    to_stdout = args.stdout or args.output == '-'
+    log = sys.stderr if to_stdout else sys.stdout
+
     # Print warnings
-    for warning in warnings:
-        print(warning)
+    if warnings:
+        log.write('\n'.join(warnings) + '\n')
 
     # Exit on errors
     if errors:
@@ -949,22 +1092,40 @@ def main():
             print(f"Error: {error}", file=sys.stderr)
         return 1
 
-    # Generate SVG
-    svg_content = generator.generate_svg()
+    if to_stdout:
+        generator.write_svg(sys.stdout)
+        sys.stdout.write('\n')  # end the stream with a newline, unlike the committed files
+        log.write(f"Template: {args.width}x{args.height} {generator.get_description()}\n")
+        return 0
 
-    # Create output directory and write file
+    # Create output directory and write file. Checked on every call, since batch callers
+    # of main() may change directory or remove the output between flags
     output_dir = args.output or './public/flags/'
     os.makedirs(output_dir, exist_ok=True)
 
     filename = f"{country_code}.svg"
     filepath = os.path.join(output_dir, filename)
 
-    with open(filepath, 'w') as f:
-        f.write(svg_content)
+    # Write to a uniquely named temporary file and rename it into place, so a failed
+    # run never leaves a truncated flag behind and parallel runs never share a temp file
+    import tempfile  # only the file output path needs it
+    tmp_file = tempfile.NamedTemporaryFile('w', buffering=65536, dir=output_dir,
+                                           prefix=f"{filename}.", suffix='.tmp', delete=False)
+    try:
+        with tmp_file as f:
+            generator.write_svg(f)
+        # Temporary files are private (0600); give the flag the mode open() would have
+        os.chmod(tmp_file.name, 0o666 & ~_current_umask())
+        os.replace(tmp_file.name, filepath)
+    except BaseException:
+        if os.path.exists(tmp_file.name):
+            os.remove(tmp_file.name)
+        raise
 
     # Print summary
-    print(f"Created: {filepath}")
-    print(f"Template: {args.width}x{args.height} {generator.get_description()}")
+    sys.stdout.write(f"Created: {filepath}\n"
+                     f"Template: {args.width}x{args.height} {generator.get_description()}\n")
+    return 0
 
 
 if __name__ == '__main__':